@@ -5,15 +5,22 @@
 专门用于集成到面试软件后端
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
 import os
-import tempfile
 import logging
 from speech_emotion_analyzer import SpeechEmotionAnalyzer
 import traceback
 import base64
 import io
+import orjson
+import queue
+import threading
+import time
+import functools
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from types import MappingProxyType
+from collections import Counter
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -23,21 +30,167 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
 
-# 全局变量 - 模型加载器(避免重复加载)
+# 微批处理配置(可通过环境变量调整)
+MAX_BATCH = int(os.environ.get('BATCH_MAX_SIZE', '8'))           # 单个批次最多聚合的请求数
+MAX_DELAY_MS = float(os.environ.get('BATCH_MAX_DELAY_MS', '20'))  # 等待凑批的最长时间(毫秒)
+REQUEST_TIMEOUT = 60   # 单个请求等待结果的超时时间(秒)
+
+# 面试情感分类和评分
+EMOTION_SCORING = MappingProxyType({
+    # 正面情感 (高分)
+    "confident": MappingProxyType({"base_score": 90, "type": "excellent", "desc": "表现出色"}),
+    "composed": MappingProxyType({"base_score": 85, "type": "excellent", "desc": "沉稳可靠"}), 
+    "calm": MappingProxyType({"base_score": 75, "type": "good", "desc": "状态良好"}),
+    "focused": MappingProxyType({"base_score": 80, "type": "good", "desc": "专注投入"}),
+    
+    # 中性情感 (中等分)
+    "excited": MappingProxyType({"base_score": 70, "type": "neutral", "desc": "略显激动"}),
+    
+    # 负面情感 (低分)
+    "nervous": MappingProxyType({"base_score": 45, "type": "poor", "desc": "显得紧张"}),
+    "anxious": MappingProxyType({"base_score": 40, "type": "poor", "desc": "较为焦虑"}),
+    "dissatisfied": MappingProxyType({"base_score": 35, "type": "poor", "desc": "情绪不佳"})
+})
+DEFAULT_EMOTION_SCORING = MappingProxyType({"base_score": 60, "type": "neutral", "desc": "状态中等"})
+
+# 各面试情感对应的建议
+EMOTION_RECOMMENDATIONS = MappingProxyType({
+    "confident": ("情感表达非常自信，表现优秀", "继续保持这种状态"),
+    "composed": ("表现沉着冷静，给人可靠感", "适当增加一些积极表达"),
+    "calm": ("状态平和稳定", "可以适当表现更多自信"),
+    "focused": ("展现出很好的专注力", "保持这种投入状态"),
+    "excited": ("表现出积极的态度", "注意控制情绪，保持专业"),
+    "nervous": ("适度紧张是正常的，注意放松", "可以通过深呼吸缓解紧张感", "多做准备有助于增强信心"),
+    "anxious": ("建议调整心态，保持冷静", "专注于问题本身，不要过度担心", "提前准备可以减少焦虑"),
+    "dissatisfied": ("注意情绪管理，保持专业态度", "即使遇到困难也要积极应对")
+})
+
+# 全局变量 - 进程内唯一的模型加载器(避免重复加载)
 analyzer = None
+batcher = None
+decode_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="audio-decode")
+format_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="result-format")
+_init_lock = threading.Lock()
+
+class RequestBatcher:
+    """
+    请求微批处理器
+    将并发到达的 /analyze 请求聚合为一个批次，共享一次模型前向推理
+    """
+    
+    def __init__(self, analyze_batch_func, max_batch=MAX_BATCH, max_delay_ms=MAX_DELAY_MS):
+        self.analyze_batch_func = analyze_batch_func
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000.0
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def start(self):
+        """启动后台批处理线程(重复调用无副作用)"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="request-batcher", daemon=True)
+                self._thread.start()
+    
+    def submit_async(self, waveform, ensemble_size=None):
+        """提交一个已预处理的波形，立即返回用于获取分析结果的 Future"""
+        self.start()
+        future = Future()
+        self.queue.put((waveform, ensemble_size, future))
+        return future
+    
+    def submit(self, waveform, ensemble_size=None, timeout=REQUEST_TIMEOUT):
+        """提交一个已预处理的波形并阻塞等待其分析结果"""
+        return self.submit_async(waveform, ensemble_size).result(timeout=timeout)
+    
+    def _collect_batch(self):
+        """取出一个批次: 凑满 max_batch 个请求或等待超过 max_delay 即返回"""
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return items
+    
+    def _run(self):
+        while True:
+            # 按集成模型数量分组，同组请求共享一次推理
+            groups = {}
+            for item in self._collect_batch():
+                groups.setdefault(item[1], []).append(item)
+            
+            for ensemble_size, items in groups.items():
+                try:
+                    results = self.analyze_batch_func(
+                        [waveform for waveform, _, _ in items],
+                        ensemble_size=ensemble_size
+                    )
+                except Exception as e:
+                    logger.error(f"批处理推理失败: {str(e)}")
+                    for _, _, future in items:
+                        future.set_exception(e)
+                    continue
+                
+                for (_, _, future), result in zip(items, results):
+                    future.set_result(result)
 
 def init_analyzer():
-    """初始化语音情感分析器"""
-    global analyzer
-    try:
-        if analyzer is None:
-            logger.info("正在初始化语音情感分析器...")
-            analyzer = SpeechEmotionAnalyzer()
-            logger.info(f"分析器初始化完成，已加载 {len(analyzer.models)} 个模型")
-        return True
-    except Exception as e:
-        logger.error(f"分析器初始化失败: {e}")
-        return False
+    """初始化语音情感分析器(线程安全，重复调用不会重复加载模型)"""
+    global analyzer, batcher
+    with _init_lock:
+        try:
+            if analyzer is None:
+                logger.info("正在初始化语音情感分析器...")
+                analyzer = SpeechEmotionAnalyzer()
+                logger.info(f"分析器初始化完成，已加载 {len(analyzer.models)} 个模型")
+            if batcher is None:
+                batcher = RequestBatcher(analyzer.analyze_audio_batch)
+                batcher.start()
+            return True
+        except Exception as e:
+            logger.error(f"分析器初始化失败: {e}")
+            return False
+
+def reinit_after_fork():
+    """
+    在 fork 出的工作进程中恢复分析器(供 gunicorn post_worker_init 调用)
+    后台线程(批处理线程、解码和格式化线程池)不会随 fork 复制，需要重建；
+    CPU 模式下主进程已预加载模型，工作进程直接复用；GPU 模式下不预加载，由每个工作进程自行加载模型
+    """
+    global batcher, decode_executor, format_executor
+    batcher = None
+    decode_executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="audio-decode")
+    format_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="result-format")
+    if analyzer is not None:
+        analyzer.reset_workers()
+    return init_analyzer()
+
+def require_analyzer(func):
+    """
+    路由装饰器: 分析器尚未初始化时先按需加载(适用于未调用 init_analyzer 的部署方式，
+    如不带配置文件的 gunicorn、uwsgi、waitress)，加载失败时返回 ANALYZER_NOT_READY
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if analyzer is None and not init_analyzer():
+            return create_response(False, None, "分析器未初始化", "ANALYZER_NOT_READY")
+        return func(*args, **kwargs)
+    return wrapper
+
+def parse_ensemble_size(value):
+    """解析 ensemble_size 参数，未提供时返回None(使用全部已加载模型)"""
+    if value is None or value == '':
+        return None
+    ensemble_size = int(value)
+    if ensemble_size < 1:
+        raise ValueError("ensemble_size 必须为正整数")
+    return ensemble_size
 
 def create_response(success=True, data=None, message="", error_code=None):
     """创建标准化的API响应"""
@@ -48,15 +201,18 @@ def create_response(success=True, data=None, message="", error_code=None):
     }
     if error_code:
         response["error_code"] = error_code
-    return jsonify(response)
+    # 使用 orjson 序列化，批量分析的大型嵌套结果编码更快
+    return app.response_class(orjson.dumps(response, option=orjson.OPT_SERIALIZE_NUMPY), mimetype='application/json')
+
+def get_json_body():
+    """使用 orjson 解析请求体中的JSON数据"""
+    return orjson.loads(request.get_data())
 
 @app.route('/health', methods=['GET'])
+@require_analyzer
 def health_check():
     """健康检查接口"""
     try:
-        if analyzer is None:
-            return create_response(False, None, "分析器未初始化", "ANALYZER_NOT_READY")
-        
         return create_response(True, {
             "status": "healthy",
             "models_loaded": len(analyzer.models),
@@ -66,59 +222,70 @@ def health_check():
         return create_response(False, None, f"健康检查失败: {str(e)}", "HEALTH_CHECK_ERROR")
 
 @app.route('/analyze', methods=['POST'])
+@require_analyzer
 def analyze_emotion():
     """
     语音情感分析接口
     
-    支持两种输入方式:
+    支持三种输入方式:
     1. 文件上传 (multipart/form-data)
     2. Base64编码的音频数据 (JSON)
+    3. 原始音频字节 (application/octet-stream)，省去Base64编码和JSON解析
+    
+    可选参数 ensemble_size: 参与集成的模型数量，数量越少速度越快
     """
     try:
-        if analyzer is None:
-            return create_response(False, None, "分析器未初始化", "ANALYZER_NOT_READY")
-        
-        audio_file_path = None
-        
         # 方式1: 文件上传
         if 'audio' in request.files:
             audio_file = request.files['audio']
             if audio_file.filename == '':
                 return create_response(False, None, "未选择文件", "NO_FILE_SELECTED")
             
-            # 保存临时文件
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-            audio_file.save(temp_file.name)
-            audio_file_path = temp_file.name
+            audio_data = audio_file.read()
+            options = request.values
             
         # 方式2: Base64编码数据
         elif request.is_json:
-            data = request.get_json()
+            data = get_json_body()
             if 'audio_data' not in data:
                 return create_response(False, None, "缺少audio_data字段", "MISSING_AUDIO_DATA")
             
             # 解码Base64音频数据
             try:
                 audio_data = base64.b64decode(data['audio_data'])
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-                temp_file.write(audio_data)
-                temp_file.close()
-                audio_file_path = temp_file.name
             except Exception as e:
                 return create_response(False, None, f"音频数据解码失败: {str(e)}", "DECODE_ERROR")
+            options = data
         
-        else:
-            return create_response(False, None, "请提供音频文件或Base64编码的音频数据", "NO_AUDIO_PROVIDED")
+        # 方式3: 原始音频字节，可选参数通过查询字符串传递
+        elif request.mimetype == 'application/octet-stream':
+            audio_data = request.get_data(cache=False)
+            if not audio_data:
+                return create_response(False, None, "请求体中没有音频数据", "NO_AUDIO_PROVIDED")
+            options = request.args
         
-        # 进行情感分析
-        logger.info(f"开始分析音频文件: {audio_file_path}")
-        result = analyzer.analyze_audio(audio_file_path)
+        else:
+            return create_response(False, None, "请提供音频文件、Base64编码的音频数据或 application/octet-stream 格式的原始音频", "NO_AUDIO_PROVIDED")
         
-        # 清理临时文件
         try:
-            os.unlink(audio_file_path)
-        except:
-            pass
+            ensemble_size = parse_ensemble_size(options.get('ensemble_size'))
+        except (TypeError, ValueError):
+            return create_response(False, None, "ensemble_size 必须为正整数", "INVALID_ENSEMBLE_SIZE")
+        
+        # 相同音频(且相同集成配置)直接复用缓存的分析结果
+        digest = analyzer.audio_digest(audio_data)
+        result = analyzer.get_cached_result((digest, ensemble_size))
+        
+        if result is None:
+            # 直接从内存解码音频，无需落盘临时文件
+            logger.info(f"开始分析音频数据: {len(audio_data)} 字节")
+            waveform, _ = analyzer.preprocess_audio(io.BytesIO(audio_data), cache_key=digest)
+            
+            # 提交到微批处理器，与并发请求共享一次模型推理
+            result = batcher.submit(waveform, ensemble_size)
+            analyzer.cache_result((digest, ensemble_size), result)
+        else:
+            logger.info("命中分析结果缓存")
         
         # 格式化响应数据
         response_data = format_analysis_result(result)
@@ -179,25 +346,8 @@ def generate_interview_assessment(final_result):
     emotion = final_result.get("recommended_emotion", "unknown")
     confidence = final_result.get("confidence", 0)
     
-    # 面试情感分类和评分
-    emotion_scoring = {
-        # 正面情感 (高分)
-        "confident": {"base_score": 90, "type": "excellent", "desc": "表现出色"},
-        "composed": {"base_score": 85, "type": "excellent", "desc": "沉稳可靠"}, 
-        "calm": {"base_score": 75, "type": "good", "desc": "状态良好"},
-        "focused": {"base_score": 80, "type": "good", "desc": "专注投入"},
-        
-        # 中性情感 (中等分)
-        "excited": {"base_score": 70, "type": "neutral", "desc": "略显激动"},
-        
-        # 负面情感 (低分)
-        "nervous": {"base_score": 45, "type": "poor", "desc": "显得紧张"},
-        "anxious": {"base_score": 40, "type": "poor", "desc": "较为焦虑"},
-        "dissatisfied": {"base_score": 35, "type": "poor", "desc": "情绪不佳"}
-    }
-    
     # 获取情感评分信息
-    emotion_info = emotion_scoring.get(emotion, {"base_score": 60, "type": "neutral", "desc": "状态中等"})
+    emotion_info = EMOTION_SCORING.get(emotion, DEFAULT_EMOTION_SCORING)
     base_score = emotion_info["base_score"]
     emotion_type = emotion_info["type"]
     emotion_desc = emotion_info["desc"]
@@ -207,34 +357,7 @@ def generate_interview_assessment(final_result):
     final_score = min(100, max(0, base_score + confidence_bonus))
     
     # 生成建议
-    recommendations = []
-    
-    if emotion == "confident":
-        recommendations.append("情感表达非常自信，表现优秀")
-        recommendations.append("继续保持这种状态")
-    elif emotion == "composed":
-        recommendations.append("表现沉着冷静，给人可靠感")
-        recommendations.append("适当增加一些积极表达")
-    elif emotion == "calm":
-        recommendations.append("状态平和稳定")
-        recommendations.append("可以适当表现更多自信")
-    elif emotion == "focused":
-        recommendations.append("展现出很好的专注力")
-        recommendations.append("保持这种投入状态")
-    elif emotion == "excited":
-        recommendations.append("表现出积极的态度")
-        recommendations.append("注意控制情绪，保持专业")
-    elif emotion == "nervous":
-        recommendations.append("适度紧张是正常的，注意放松")
-        recommendations.append("可以通过深呼吸缓解紧张感")
-        recommendations.append("多做准备有助于增强信心")
-    elif emotion == "anxious":
-        recommendations.append("建议调整心态，保持冷静")
-        recommendations.append("专注于问题本身，不要过度担心")
-        recommendations.append("提前准备可以减少焦虑")
-    elif emotion == "dissatisfied":
-        recommendations.append("注意情绪管理，保持专业态度")
-        recommendations.append("即使遇到困难也要积极应对")
+    recommendations = list(EMOTION_RECOMMENDATIONS.get(emotion, ()))
     
     # 根据置信度添加建议
     if confidence < 0.4:
@@ -256,41 +379,99 @@ def generate_interview_assessment(final_result):
         }
     }
 
+def decode_segment(segment_data, ensemble_size=None):
+    """
+    解码单个Base64音频片段(在解码线程池中执行)
+    Returns:
+        tuple: (音频哈希, 已缓存的分析结果或None, 预处理后的波形或None)
+    """
+    audio_data = base64.b64decode(segment_data)
+    digest = analyzer.audio_digest(audio_data)
+    
+    cached_result = analyzer.get_cached_result((digest, ensemble_size))
+    if cached_result is not None:
+        return digest, cached_result, None
+    
+    waveform, _ = analyzer.preprocess_audio(io.BytesIO(audio_data), cache_key=digest)
+    return digest, None, waveform
+
+def format_when_done(inference_future, cache_key):
+    """推理完成后在格式化线程池中缓存并格式化结果，返回格式化结果的 Future"""
+    formatted_future = Future()
+    
+    def finish(future):
+        try:
+            result = future.result()
+            analyzer.cache_result(cache_key, result)
+            formatted_future.set_result(format_analysis_result(result))
+        except Exception as e:
+            formatted_future.set_exception(e)
+    
+    # 回调在微批处理线程中触发，只负责把格式化工作转交给格式化线程池
+    inference_future.add_done_callback(lambda future: format_executor.submit(finish, future))
+    return formatted_future
+
 @app.route('/batch_analyze', methods=['POST'])
+@require_analyzer
 def batch_analyze():
     """批量分析接口(适用于分析整个面试会话)"""
     try:
-        if analyzer is None:
-            return create_response(False, None, "分析器未初始化", "ANALYZER_NOT_READY")
-        
         if not request.is_json:
             return create_response(False, None, "请提供JSON格式数据", "INVALID_FORMAT")
         
-        data = request.get_json()
+        data = get_json_body()
         audio_segments = data.get('audio_segments', [])
         
         if not audio_segments:
             return create_response(False, None, "请提供音频片段数据", "NO_AUDIO_SEGMENTS")
         
-        # 分析每个音频片段
+        try:
+            ensemble_size = parse_ensemble_size(data.get('ensemble_size'))
+        except (TypeError, ValueError):
+            return create_response(False, None, "ensemble_size 必须为正整数", "INVALID_ENSEMBLE_SIZE")
+        
+        # 整个请求共用一个超时期限，避免逐个片段等待时超时时间累加
+        deadline = time.monotonic() + REQUEST_TIMEOUT
+        
+        # 流水线处理: 解码(线程池) -> 推理(微批处理线程) -> 格式化(线程池)
+        # 按顺序取回解码结果并立即提交推理，推理完成后立即格式化，各阶段相互重叠
+        decode_futures = [
+            decode_executor.submit(decode_segment, segment_data, ensemble_size)
+            for segment_data in audio_segments
+        ]
+        
+        format_futures = [None] * len(audio_segments)  # 片段索引 -> 格式化结果 Future
+        inflight = {}  # 音频哈希 -> 格式化结果 Future(重复片段只推理一次)
+        for i, decode_future in enumerate(decode_futures):
+            try:
+                digest, cached_result, waveform = decode_future.result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception as e:
+                # 解码失败或超时(超时则取消尚未开始的解码)，收集结果时统一报告该片段的错误
+                if decode_future.cancel() or not decode_future.done():
+                    e = TimeoutError(f"音频解码超时(超过 {REQUEST_TIMEOUT} 秒)")
+                format_futures[i] = Future()
+                format_futures[i].set_exception(e)
+                continue
+            
+            if cached_result is not None:
+                format_futures[i] = format_executor.submit(format_analysis_result, cached_result)
+                continue
+            
+            if digest not in inflight:
+                inference_future = batcher.submit_async(waveform, ensemble_size)
+                inflight[digest] = format_when_done(inference_future, (digest, ensemble_size))
+            format_futures[i] = inflight[digest]
+        
+        # 在剩余时间内等待所有片段完成，届时仍未完成的片段记为超时
+        wait(format_futures, timeout=max(deadline - time.monotonic(), 0))
+        
+        # 按片段顺序收集结果
         results = []
-        for i, segment_data in enumerate(audio_segments):
+        for i, format_future in enumerate(format_futures):
             try:
-                # 解码Base64音频数据
-                audio_data = base64.b64decode(segment_data)
-                temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.wav')
-                temp_file.write(audio_data)
-                temp_file.close()
-                
-                # 分析单个片段
-                result = analyzer.analyze_audio(temp_file.name)
-                formatted_result = format_analysis_result(result)
-                formatted_result['segment_id'] = i + 1
-                results.append(formatted_result)
-                
-                # 清理临时文件
-                os.unlink(temp_file.name)
-                
+                if not format_future.done():
+                    raise TimeoutError(f"分析超时(超过 {REQUEST_TIMEOUT} 秒)")
+                results.append(dict(format_future.result(), segment_id=i + 1))
             except Exception as e:
                 logger.error(f"分析片段 {i+1} 时发生错误: {str(e)}")
                 results.append({
@@ -319,9 +500,7 @@ def generate_overall_report(results):
     
     # 统计情感分布
     emotions = [r['final_result']['recommended_emotion'] for r in valid_results]
-    emotion_counts = {}
-    for emotion in emotions:
-        emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+    emotion_counts = dict(Counter(emotions))
     
     # 计算平均分数
     scores = [r['interview_assessment']['score'] for r in valid_results]
@@ -333,10 +512,11 @@ def generate_overall_report(results):
     # 情感稳定性
     stability = 1 - (len(set(emotions)) / len(emotions))
     
-    # 面试表现分析
-    excellent_count = sum(1 for r in valid_results if r['interview_assessment']['emotion_type'] == 'excellent')
-    good_count = sum(1 for r in valid_results if r['interview_assessment']['emotion_type'] == 'good')
-    poor_count = sum(1 for r in valid_results if r['interview_assessment']['emotion_type'] == 'poor')
+    # 面试表现分析(一次遍历统计各类型片段数)
+    type_counts = Counter(r['interview_assessment']['emotion_type'] for r in valid_results)
+    excellent_count = type_counts['excellent']
+    good_count = type_counts['good']
+    poor_count = type_counts['poor']
     
     # 整体评价
     if avg_score >= 80:
@@ -394,6 +574,7 @@ if __name__ == "__main__":
     logger.info("正在启动语音情感分析API服务器...")
     
     if init_analyzer():
+        analyzer.warmup()
         logger.info("API服务器启动成功！")
         print("🎤 语音情感分析API服务器")
         print("=" * 40)
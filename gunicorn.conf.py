@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Gunicorn 配置文件
+用法: gunicorn -c gunicorn.conf.py emotion_api:app
+
+CPU 模式下启用 preload_app: 模型在主进程中只加载一次，工作进程 fork 后共享模型权重(写时复制)
+GPU 模式下关闭 preload_app: CUDA 上下文无法跨 fork 使用，主进程不接触CUDA，由每个工作进程自行加载模型
+可通过环境变量 GUNICORN_PRELOAD=0/1 显式指定
+"""
+
+import os
+
+def _cuda_available():
+    """检测是否有可用GPU(使用基于NVML的检测，不会在主进程中初始化CUDA)"""
+    os.environ.setdefault('PYTORCH_NVML_BASED_CUDA_CHECK', '1')
+    import torch
+    return torch.cuda.is_available()
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS', '1'))  # GPU模式下建议保持1个进程，依靠线程和微批处理提升吞吐
+threads = int(os.environ.get('GUNICORN_THREADS', '8'))
+timeout = 120
+preload_app = (os.environ.get('GUNICORN_PRELOAD') or ('0' if _cuda_available() else '1')) == '1'
+
+def when_ready(server):
+    """主进程就绪、尚未 fork 工作进程时调用: 预加载模式下在主进程中加载模型"""
+    if server.cfg.preload_app:
+        from emotion_api import init_analyzer
+        if not init_analyzer():
+            server.log.error("主进程中分析器初始化失败")
+
+def post_worker_init(worker):
+    """工作进程启动后初始化分析器并预热模型(重建后台线程，GPU模式下在此加载模型)"""
+    import emotion_api
+    if emotion_api.reinit_after_fork():
+        # 预热只在实际处理请求的工作进程中进行
+        emotion_api.analyzer.warmup()
+    else:
+        worker.log.error("工作进程中分析器初始化失败")
@@ -1,7 +1,15 @@
 import torch
-import librosa
+import torchaudio
+import soundfile as sf
 import numpy as np
-import pandas as pd
+import os
+import hashlib
+import json
+import threading
+import contextlib
+import itertools
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor
 from transformers import (
     AutoModelForAudioClassification, 
     Wav2Vec2FeatureExtractor,
@@ -11,294 +19,540 @@ from transformers import (
 import warnings
 warnings.filterwarnings('ignore')
 
+# 各模型的显示名称及其原始情感类别(顺序与模型输出logits一致)
+MODEL_SPECS = {
+    'exhubert': ('ExHuBERT', ['低唤醒-负面', '低唤醒-中性', '低唤醒-正面', '高唤醒-负面', '高唤醒-中性', '高唤醒-正面']),
+    'hubert_large': ('HuBERT Large', ['愤怒', '高兴', '中性', '悲伤']),
+    'wav2vec2_xlsr': ('Wav2Vec2 XLSR', ['愤怒', '平静', '厌恶', '恐惧', '高兴', '中性', '悲伤', '惊讶'])
+}
+
+# 面试相关情感类别
+INTERVIEW_EMOTIONS = ('nervous', 'anxious', 'calm', 'confident', 'composed', 'focused', 'excited', 'dissatisfied')
+
+# 面试情感映射规则: 原始情感 -> 面试情感
+EMOTION_MAPPING = {
+    '愤怒': 'nervous',
+    '悲伤': 'anxious', 
+    '恐惧': 'nervous',
+    '厌恶': 'dissatisfied',
+    '高兴': 'confident',
+    '中性': 'calm',
+    '惊讶': 'excited',
+    '平静': 'calm',
+    
+    # ExHuBERT特殊映射
+    '低唤醒-负面': 'anxious',
+    '低唤醒-中性': 'calm', 
+    '低唤醒-正面': 'composed',
+    '高唤醒-负面': 'nervous',
+    '高唤醒-中性': 'focused',
+    '高唤醒-正面': 'confident'
+}
+
+# 基于主导情感的面试建议
+EMOTION_ADVICE = {
+    'calm': "表现较为平稳，建议适当表达更多积极情感",
+    'confident': "表现出良好的积极态度，继续保持",
+    'composed': "表现沉着冷静，这是面试的优势",
+    'nervous': "建议控制情绪，保持专业态度",
+    'anxious': "可能需要调整心态，展现更积极的一面",
+    'focused': "建议放松心态，增强自信",
+    'excited': "反应敏锐，但注意保持专业性",
+    'dissatisfied': "建议调整态度，保持开放的心态"
+}
+
 class SpeechEmotionAnalyzer:
     """
     高精度语音情感分析器
     集成多个SOTA模型用于面试语音情感分析
     """
     
-    def __init__(self):
+    def __init__(self, cache_size=128, precision=None, compile_mode=None, active_models=None, early_exit_threshold=None,
+                 bucket_size=8, pad_to_max_length=None):
+        """
+        Args:
+            cache_size: 波形/结果缓存的最大条目数，0 表示禁用缓存
+            precision: 模型推理精度 'auto' | 'fp32' | 'fp16' | 'bf16'，'auto' 在GPU上使用fp16、CPU上使用fp32；
+                默认读取环境变量 MODEL_PRECISION，未设置时为 'auto'
+            compile_mode: 传给 torch.compile 的 mode(如 'default'、'max-autotune')；
+                默认读取环境变量 TORCH_COMPILE_MODE，未设置时不编译
+            active_models: 需要加载的模型键名列表(见 MODEL_SPECS)，默认读取环境变量 ACTIVE_MODELS(逗号分隔)，未设置时加载全部
+            early_exit_threshold: 提前退出阈值，ExHuBERT 置信度超过该值时跳过其余模型(ExHuBERT 未参与集成时不生效)；
+                默认读取环境变量 EARLY_EXIT_CONFIDENCE，未设置时不提前退出
+            bucket_size: 批量推理时每个桶(只包含等长样本)的最大样本数
+            pad_to_max_length: 预处理时是否把音频统一填充到 max_length；为False时保留原始长度(最短填充到 min_length)，
+                以减少短片段的无效计算。默认读取环境变量 DYNAMIC_PADDING，设为1时不填充
+        """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         print(f"使用设备: {self.device}")
         
+        # 集成模型配置
+        if active_models is None:
+            env_models = os.environ.get('ACTIVE_MODELS', '')
+            active_models = [m.strip() for m in env_models.split(',') if m.strip()] or list(MODEL_SPECS)
+        unknown_models = set(active_models) - set(MODEL_SPECS)
+        if unknown_models:
+            raise ValueError(f"未知的模型: {', '.join(sorted(unknown_models))}，可选: {', '.join(MODEL_SPECS)}")
+        self.active_models = [m for m in MODEL_SPECS if m in active_models]
+        
+        if early_exit_threshold is None and os.environ.get('EARLY_EXIT_CONFIDENCE'):
+            early_exit_threshold = float(os.environ['EARLY_EXIT_CONFIDENCE'])
+        self.early_exit_threshold = early_exit_threshold
+        
+        # 批量推理的分桶与填充配置
+        if pad_to_max_length is None:
+            pad_to_max_length = os.environ.get('DYNAMIC_PADDING', '0') != '1'
+        self.bucket_size = bucket_size
+        self.pad_to_max_length = pad_to_max_length
+        
+        # 推理精度与编译设置
+        if precision is None:
+            precision = os.environ.get('MODEL_PRECISION', 'auto').strip().lower() or 'auto'
+        if precision not in ('auto', 'fp32', 'fp16', 'bf16'):
+            raise ValueError(f"未知的推理精度: {precision}，可选: auto, fp32, fp16, bf16")
+        if compile_mode is None:
+            compile_mode = os.environ.get('TORCH_COMPILE_MODE', '').strip() or None
+        if precision == 'auto':
+            precision = 'fp16' if self.device.type == 'cuda' else 'fp32'
+        self.model_dtype = {'fp32': torch.float32, 'fp16': torch.float16, 'bf16': torch.bfloat16}[precision]
+        self.compile_mode = compile_mode
+        print(f"推理精度: {precision}")
+        
+        # 预先构建各模型的情感映射矩阵并放到设备上，推理后只需一次矩阵乘法
+        self._interview_emotions = np.array(INTERVIEW_EMOTIONS)
+        self._mapping_tensors = {
+            model_key: torch.from_numpy(self.build_mapping_matrix(original_emotions)).to(self.device)
+            for model_key, (_, original_emotions) in MODEL_SPECS.items()
+        }
+        
+        # 按音频哈希缓存预处理后的波形和分析结果(LRU，超出容量时淘汰最旧条目)
+        self.cache_size = cache_size
+        self._waveform_cache = OrderedDict()
+        self._result_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        
         # 初始化多个模型
         self.models = {}
         self.feature_extractors = {}
         self.load_models()
     
+    def _prepare_model(self, model):
+        """将模型切换为推理模式，移动到目标设备并转换精度，按需使用 torch.compile 编译"""
+        model = model.eval().to(self.device, dtype=self.model_dtype)
+        
+        if self.compile_mode:
+            try:
+                model = torch.compile(model, mode=self.compile_mode)
+            except Exception as e:
+                print(f"torch.compile 编译失败，使用即时执行模式: {e}")
+        
+        return model
+    
     def load_models(self):
         """加载多个高精度语音情感分析模型"""
         print("正在加载语音情感分析模型...")
         
-        try:
-            # 1. ExHuBERT - 高精度多语言情感模型 (推荐用于面试场景)
-            print("加载 ExHuBERT 模型...")
-            self.models['exhubert'] = AutoModelForAudioClassification.from_pretrained(
-                "amiriparian/ExHuBERT", 
-                trust_remote_code=True
-            ).to(self.device)
-            self.feature_extractors['exhubert'] = Wav2Vec2FeatureExtractor.from_pretrained(
-                "facebook/hubert-base-ls960"
-            )
-            print("✓ ExHuBERT 模型加载完成")
+        if 'exhubert' in self.active_models:
+            try:
+                # 1. ExHuBERT - 高精度多语言情感模型 (推荐用于面试场景)
+                print("加载 ExHuBERT 模型...")
+                self.models['exhubert'] = self._prepare_model(AutoModelForAudioClassification.from_pretrained(
+                    "amiriparian/ExHuBERT", 
+                    trust_remote_code=True
+                ))
+                self.feature_extractors['exhubert'] = Wav2Vec2FeatureExtractor.from_pretrained(
+                    "facebook/hubert-base-ls960"
+                )
+                print("✓ ExHuBERT 模型加载完成")
             
-        except Exception as e:
-            print(f"ExHuBERT 模型加载失败: {e}")
-        
-        try:
-            # 2. HuBERT Large - SUPERB基准测试模型
-            print("加载 HuBERT Large 模型...")
-            self.models['hubert_large'] = HubertForSequenceClassification.from_pretrained(
-                "superb/hubert-large-superb-er"
-            ).to(self.device)
-            self.feature_extractors['hubert_large'] = Wav2Vec2FeatureExtractor.from_pretrained(
-                "superb/hubert-large-superb-er"
-            )
-            print("✓ HuBERT Large 模型加载完成")
+            except Exception as e:
+                print(f"ExHuBERT 模型加载失败: {e}")
+        
+        if 'hubert_large' in self.active_models:
+            try:
+                # 2. HuBERT Large - SUPERB基准测试模型
+                print("加载 HuBERT Large 模型...")
+                self.models['hubert_large'] = self._prepare_model(HubertForSequenceClassification.from_pretrained(
+                    "superb/hubert-large-superb-er"
+                ))
+                self.feature_extractors['hubert_large'] = Wav2Vec2FeatureExtractor.from_pretrained(
+                    "superb/hubert-large-superb-er"
+                )
+                print("✓ HuBERT Large 模型加载完成")
             
-        except Exception as e:
-            print(f"HuBERT Large 模型加载失败: {e}")
-        
-        try:
-            # 3. Wav2Vec2 XLSR - 多语言情感识别模型
-            print("加载 Wav2Vec2 XLSR 模型...")
-            self.models['wav2vec2_xlsr'] = AutoModelForAudioClassification.from_pretrained(
-                "ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition"
-            ).to(self.device)
-            self.feature_extractors['wav2vec2_xlsr'] = Wav2Vec2FeatureExtractor.from_pretrained(
-                "ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition"
-            )
-            print("✓ Wav2Vec2 XLSR 模型加载完成")
+            except Exception as e:
+                print(f"HuBERT Large 模型加载失败: {e}")
+        
+        if 'wav2vec2_xlsr' in self.active_models:
+            try:
+                # 3. Wav2Vec2 XLSR - 多语言情感识别模型
+                print("加载 Wav2Vec2 XLSR 模型...")
+                self.models['wav2vec2_xlsr'] = self._prepare_model(AutoModelForAudioClassification.from_pretrained(
+                    "ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition"
+                ))
+                self.feature_extractors['wav2vec2_xlsr'] = Wav2Vec2FeatureExtractor.from_pretrained(
+                    "ehcalabres/wav2vec2-lg-xlsr-en-speech-emotion-recognition"
+                )
+                print("✓ Wav2Vec2 XLSR 模型加载完成")
             
-        except Exception as e:
-            print(f"Wav2Vec2 XLSR 模型加载失败: {e}")
+            except Exception as e:
+                print(f"Wav2Vec2 XLSR 模型加载失败: {e}")
         
         if not self.models:
             raise Exception("所有模型加载失败，请检查网络连接和模型可用性")
+        
+        # 记录各特征提取器的配置，配置相同的提取器可共享同一份特征
+        self._feature_signatures = {
+            model_key: json.dumps(extractor.to_dict(), sort_keys=True, default=str)
+            for model_key, extractor in self.feature_extractors.items()
+        }
+        
+        self.reset_workers()
+    
+    def reset_workers(self):
+        """
+        创建并发推理所需的线程池和CUDA流
+        各模型相互独立，使用线程池并发推理；GPU上每个模型使用独立的CUDA流
+        线程不会随 fork 复制，在 fork 出的子进程中需要重新调用
+        """
+        self._executor = ThreadPoolExecutor(max_workers=len(self.models), thread_name_prefix="emotion-model")
+        self._streams = {}
+        if self.device.type == "cuda":
+            self._streams = {model_key: torch.cuda.Stream(device=self.device) for model_key in self.models}
+    
+    def warmup(self, max_length=48000, rounds=2):
+        """
+        使用静音波形预热模型，避免首个真实请求承担CUDA内核选择和显存分配的开销
+        分别以单条和整桶样本各运行 rounds 次，覆盖单请求和批量推理两种输入形状
+        """
+        if self.device.type == "cuda":
+            torch.backends.cudnn.benchmark = True
+        
+        silence = np.zeros(max_length, dtype=np.float32)
+        for batch_size in sorted({1, self.bucket_size}):
+            for _ in range(rounds):
+                self.analyze_audio_batch([silence] * batch_size)
+    
+    @staticmethod
+    def audio_digest(audio_bytes):
+        """计算原始音频字节的哈希值，用作缓存键(或缓存键的一部分)"""
+        return hashlib.sha1(audio_bytes).digest()
+    
+    def _cache_get(self, cache, key):
+        if key is None or self.cache_size <= 0:
+            return None
+        with self._cache_lock:
+            value = cache.get(key)
+            if value is not None:
+                cache.move_to_end(key)
+            return value
+    
+    def _cache_put(self, cache, key, value):
+        if key is None or self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            cache[key] = value
+            cache.move_to_end(key)
+            while len(cache) > self.cache_size:
+                cache.popitem(last=False)
+    
+    def get_cached_result(self, key):
+        """按缓存键(音频哈希，可附带分析配置)查询已缓存的分析结果，未命中时返回None"""
+        return self._cache_get(self._result_cache, key)
     
-    def preprocess_audio(self, audio_path, target_sr=16000, max_length=48000):
+    def cache_result(self, key, result):
+        """按音频哈希缓存分析结果(有模型推理失败、结果不完整时不缓存，下次请求重新分析)"""
+        if not result.get('complete'):
+            return
+        self._cache_put(self._result_cache, key, result)
+    
+    def clear_cache(self):
+        """清空波形和结果缓存"""
+        with self._cache_lock:
+            self._waveform_cache.clear()
+            self._result_cache.clear()
+    
+    def preprocess_audio(self, audio_path, target_sr=16000, max_length=48000, min_length=16000, cache_key=None):
         """
         预处理音频文件
         Args:
-            audio_path: 音频文件路径
+            audio_path: 音频文件路径或文件对象(如 io.BytesIO)
             target_sr: 目标采样率
             max_length: 最大长度(3秒 * 16kHz = 48000)
+            min_length: 不填充到 max_length 时的最短长度(默认1秒)，过短的片段小于模型卷积前端的感受野会导致推理失败
+            cache_key: 可选的音频哈希(见 audio_digest)，提供时复用已缓存的波形
         """
+        waveform_key = (cache_key, target_sr, max_length, min_length) if cache_key is not None else None
+        cached = self._cache_get(self._waveform_cache, waveform_key)
+        if cached is not None:
+            return cached, target_sr
+        
         try:
-            # 加载音频文件
-            waveform, sr = librosa.load(audio_path, sr=target_sr)
+            # 加载音频文件(soundfile 同样支持内存中的文件对象)，多声道取平均转为单声道
+            # 不使用 torchaudio.load: torchaudio 2.9 起其解码依赖额外的 torchcodec 包
+            audio, sr = sf.read(audio_path, dtype='float32', always_2d=True)
+            waveform = torch.from_numpy(audio.mean(axis=1))
+            
+            # 重采样到目标采样率
+            if sr != target_sr:
+                waveform = torchaudio.functional.resample(waveform, sr, target_sr)
             
-            # 填充或截断到固定长度
-            if len(waveform) > max_length:
+            # 截断到最大长度，按配置填充到固定长度或最短长度
+            padded_length = max_length if self.pad_to_max_length else min(min_length, max_length)
+            if waveform.shape[0] > max_length:
                 waveform = waveform[:max_length]
-            else:
-                waveform = np.pad(waveform, (0, max_length - len(waveform)))
+            elif waveform.shape[0] < padded_length:
+                waveform = torch.nn.functional.pad(waveform, (0, padded_length - waveform.shape[0]))
+            
+            # 特征提取器接收NumPy数组
+            waveform = waveform.numpy()
+            
+            self._cache_put(self._waveform_cache, waveform_key, waveform)
             
             return waveform, target_sr
         
         except Exception as e:
             raise Exception(f"音频预处理失败: {e}")
     
-    def map_to_interview_emotions(self, original_emotions, scores):
-        """将原始情感映射到面试相关情感"""
-        # 面试情感映射规则
-        mapping = {
-            # 原始情感 -> 面试情感
-            '愤怒': 'nervous',
-            '悲伤': 'anxious', 
-            '恐惧': 'nervous',
-            '厌恶': 'dissatisfied',
-            '高兴': 'confident',
-            '中性': 'calm',
-            '惊讶': 'excited',
-            '平静': 'calm',
-            
-            # ExHuBERT特殊映射
-            '低唤醒-负面': 'anxious',
-            '低唤醒-中性': 'calm', 
-            '低唤醒-正面': 'composed',
-            '高唤醒-负面': 'nervous',
-            '高唤醒-中性': 'focused',
-            '高唤醒-正面': 'confident'
-        }
-        
-        # 面试相关情感类别
-        interview_emotions = ['nervous', 'anxious', 'calm', 'confident', 'composed', 'focused', 'excited', 'dissatisfied']
-        
-        # 创建面试情感得分字典
-        interview_scores = {emotion: 0.0 for emotion in interview_emotions}
-        
-        # 映射和累积得分
-        for i, original_emotion in enumerate(original_emotions):
-            if original_emotion in mapping:
-                interview_emotion = mapping[original_emotion]
-                interview_scores[interview_emotion] += float(scores[i])
+    @staticmethod
+    def build_mapping_matrix(original_emotions):
+        """
+        构建原始情感到面试情感的映射矩阵
+        Returns:
+            np.ndarray: 形状为 (面试情感数, 原始情感数)，M[i, j] = 1 表示原始情感 j 映射到面试情感 i
+        """
+        matrix = np.zeros((len(INTERVIEW_EMOTIONS), len(original_emotions)), dtype=np.float32)
+        for j, original_emotion in enumerate(original_emotions):
+            if original_emotion in EMOTION_MAPPING:
+                matrix[INTERVIEW_EMOTIONS.index(EMOTION_MAPPING[original_emotion]), j] = 1.0
+        return matrix
+    
+    def _pin_inputs(self, inputs):
+        """GPU模式下将输入张量放入锁页内存，以便异步(non_blocking)拷贝到显存"""
+        if self.device.type != 'cuda':
+            return dict(inputs)
+        return {k: v.pin_memory() for k, v in inputs.items()}
+    
+    def extract_features(self, waveforms, model_keys=None):
+        """
+        对一批波形计算各模型的输入特征
+        配置完全相同的特征提取器只计算一次，结果在对应模型间共享
+        Args:
+            waveforms: 已预处理的波形列表，不等长时填充到其中最长的长度
+            model_keys: 需要计算特征的模型键名列表，默认为所有已加载模型
+        Returns:
+            dict: 模型键名 -> 特征字典(CPU张量，GPU模式下位于锁页内存)
+        """
+        features = {}
+        computed = {}  # 特征提取器配置 -> 已计算的特征
         
-        # 找到最高得分的情感
-        predicted_emotion = max(interview_scores, key=interview_scores.get)
-        confidence = interview_scores[predicted_emotion]
+        for model_key in (model_keys if model_keys is not None else MODEL_SPECS):
+            if model_key not in self.feature_extractors:
+                continue
+            
+            signature = self._feature_signatures[model_key]
+            if signature not in computed:
+                computed[signature] = self._pin_inputs(self.feature_extractors[model_key](
+                    list(waveforms), 
+                    sampling_rate=16000, 
+                    padding='longest', 
+                    return_tensors="pt"
+                ))
+            features[model_key] = computed[signature]
+        
+        return features
+    
+    def analyze_with_exhubert(self, inputs):
+        """使用ExHuBERT模型进行情感分析(inputs 为 extract_features 的对应结果)"""
+        results = self.analyze_batch_with_model('exhubert', inputs)
+        return results[0] if results else None
+    
+    def analyze_with_hubert_large(self, inputs):
+        """使用HuBERT Large模型进行情感分析(inputs 为 extract_features 的对应结果)"""
+        results = self.analyze_batch_with_model('hubert_large', inputs)
+        return results[0] if results else None
+    
+    def analyze_with_wav2vec2_xlsr(self, inputs):
+        """使用Wav2Vec2 XLSR模型进行情感分析(inputs 为 extract_features 的对应结果)"""
+        results = self.analyze_batch_with_model('wav2vec2_xlsr', inputs)
+        return results[0] if results else None
+    
+    def analyze_audio(self, audio_path, ensemble_size=None):
+        """
+        完整的音频情感分析流程
+        Args:
+            audio_path: 音频文件路径或文件对象
+            ensemble_size: 参与集成的模型数量(按 MODEL_SPECS 顺序取前N个已加载模型)，默认使用全部
+        Returns:
+            dict: 包含所有模型分析结果的字典
+        """
+        print(f"开始分析音频文件: {audio_path}")
         
-        # 确保所有值都是Python原生类型
-        interview_scores = {k: float(v) for k, v in interview_scores.items()}
+        # 预处理音频
+        waveform, sr = self.preprocess_audio(audio_path)
         
-        return interview_scores, predicted_emotion, float(confidence)
-
-    def analyze_with_exhubert(self, waveform):
-        """使用ExHuBERT模型进行情感分析"""
-        if 'exhubert' not in self.models:
-            return None
+        results = self.analyze_audio_batch([waveform], sr, ensemble_size)[0]
+        results['audio_file'] = audio_path
         
-        try:
-            # 预处理
-            inputs = self.feature_extractors['exhubert'](
-                waveform, 
-                sampling_rate=16000, 
-                padding='max_length', 
-                max_length=48000,
-                return_tensors="pt"
-            )
-            
-            # 推理
-            with torch.no_grad():
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                output = self.models['exhubert'](**inputs)
-                probs = torch.nn.functional.softmax(output.logits, dim=-1)
-            
-            # ExHuBERT的6个类别
-            original_emotions = ['低唤醒-负面', '低唤醒-中性', '低唤醒-正面', '高唤醒-负面', '高唤醒-中性', '高唤醒-正面']
-            scores = probs.cpu().numpy()[0]
-            
-            # 映射到面试情感
-            interview_scores, predicted_emotion, confidence = self.map_to_interview_emotions(original_emotions, scores)
-            
-            result = {
-                'model': 'ExHuBERT',
-                'emotions': interview_scores,
-                'predicted_emotion': predicted_emotion,
-                'confidence': float(confidence)
-            }
-            
-            return result
-            
-        except Exception as e:
-            print(f"ExHuBERT 分析失败: {e}")
-            return None
+        return results
     
-    def analyze_with_hubert_large(self, waveform):
-        """使用HuBERT Large模型进行情感分析"""
-        if 'hubert_large' not in self.models:
+    def analyze_batch_with_model(self, model_key, inputs):
+        """
+        使用单个模型对一批特征进行一次前向推理
+        Args:
+            model_key: 模型键名(见 MODEL_SPECS)
+            inputs: extract_features 为该模型计算的特征字典，批次维度为 N
+        Returns:
+            list: 每个样本对应的模型结果字典，模型不可用或推理失败时返回None
+        """
+        if model_key not in self.models:
             return None
         
+        model_name = MODEL_SPECS[model_key][0]
+        stream = self._streams.get(model_key)
+        
         try:
-            # 预处理
-            inputs = self.feature_extractors['hubert_large'](
-                waveform, 
-                sampling_rate=16000, 
-                padding=True, 
-                return_tensors="pt"
-            )
-            
-            # 推理
-            with torch.no_grad():
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                output = self.models['hubert_large'](**inputs)
-                probs = torch.nn.functional.softmax(output.logits, dim=-1)
+            # 推理(GPU上在该模型专属的CUDA流中执行，与其他模型重叠)
+            with torch.inference_mode(), (torch.cuda.stream(stream) if stream is not None else contextlib.nullcontext()):
+                # 输入位于锁页内存，异步拷贝可与其他模型的计算重叠
+                inputs = {
+                    k: v.to(self.device, dtype=self.model_dtype, non_blocking=True) if v.is_floating_point()
+                    else v.to(self.device, non_blocking=True)
+                    for k, v in inputs.items()
+                }
+                output = self.models[model_key](**inputs)
+                # softmax 在FP32下计算以保证数值稳定
+                probs = torch.nn.functional.softmax(output.logits.float(), dim=-1)
+                
+                # 在设备上完成面试情感映射和argmax，只把 (B, 8+1) 的结果一次性拷回CPU
+                interview = probs @ self._mapping_tensors[model_key].T
+                pred_idx = interview.argmax(dim=-1)
+                packed = torch.cat((interview, pred_idx.unsqueeze(-1).float()), dim=-1)
             
-            # IEMOCAP的4个类别
-            original_emotions = ['愤怒', '高兴', '中性', '悲伤']
-            scores = probs.cpu().numpy()[0]
+            if stream is not None:
+                stream.synchronize()
+            packed = packed.cpu().numpy()
             
-            # 映射到面试情感
-            interview_scores, predicted_emotion, confidence = self.map_to_interview_emotions(original_emotions, scores)
+            interview_batch = packed[:, :-1]
+            pred_idx = packed[:, -1].astype(np.int64)
+            predicted_emotions = self._interview_emotions[pred_idx].tolist()
+            confidences = interview_batch[np.arange(len(interview_batch)), pred_idx]
             
-            result = {
-                'model': 'HuBERT Large',
-                'emotions': interview_scores,
-                'predicted_emotion': predicted_emotion,
-                'confidence': float(confidence)
-            }
+            results = []
+            for interview_scores, predicted_emotion, confidence in zip(interview_batch.tolist(), predicted_emotions, confidences.tolist()):
+                results.append({
+                    'model': model_name,
+                    'emotions': dict(zip(INTERVIEW_EMOTIONS, interview_scores)),
+                    'predicted_emotion': predicted_emotion,
+                    'confidence': confidence
+                })
             
-            return result
+            return results
             
         except Exception as e:
-            print(f"HuBERT Large 分析失败: {e}")
+            print(f"{model_name} 分析失败: {e}")
             return None
     
-    def analyze_with_wav2vec2_xlsr(self, waveform):
-        """使用Wav2Vec2 XLSR模型进行情感分析"""
-        if 'wav2vec2_xlsr' not in self.models:
-            return None
+    def _run_models(self, model_keys, features, batch_results, indices):
+        """并发运行多个模型，并将结果追加到 indices 对应的样本结果中"""
+        # 只选取需要推理的样本
+        if len(indices) != len(batch_results):
+            index_tensor = torch.tensor(indices)
+            subsets = {}  # 共享同一份特征的模型也共享同一份子集
+            for model_key in model_keys:
+                source = features[model_key]
+                if id(source) not in subsets:
+                    subsets[id(source)] = self._pin_inputs({k: v[index_tensor] for k, v in source.items()})
+            features = {model_key: subsets[id(features[model_key])] for model_key in model_keys}
+        
+        # 所有模型并发进行批量分析，结果按模型顺序收集
+        futures = [
+            self._executor.submit(self.analyze_batch_with_model, model_key, features[model_key])
+            for model_key in model_keys
+        ]
+        for future in futures:
+            model_results = future.result()
+            if model_results:
+                for i, model_result in zip(indices, model_results):
+                    batch_results[i]['models_results'].append(model_result)
+    
+    def _analyze_bucket(self, waveforms, batch_results, model_keys):
+        """
+        对一个等长样本的桶进行特征提取和多模型推理，结果追加到 batch_results 中
+        并为每个样本标记 complete: 所有计划运行的模型(提前退出时仅ExHuBERT)均返回了结果
+        """
+        # 每个样本预期得到的模型结果数
+        expected = [len(model_keys)] * len(batch_results)
+        for result in batch_results:
+            result['complete'] = False
         
+        # 特征只计算一次，供所有模型复用
         try:
-            # 预处理
-            inputs = self.feature_extractors['wav2vec2_xlsr'](
-                waveform, 
-                sampling_rate=16000, 
-                return_tensors="pt"
-            )
-            
-            # 推理
-            with torch.no_grad():
-                inputs = {k: v.to(self.device) for k, v in inputs.items()}
-                output = self.models['wav2vec2_xlsr'](**inputs)
-                probs = torch.nn.functional.softmax(output.logits, dim=-1)
-            
-            # RAVDESS的8个情感类别
-            original_emotions = ['愤怒', '平静', '厌恶', '恐惧', '高兴', '中性', '悲伤', '惊讶']
-            scores = probs.cpu().numpy()[0]
-            
-            # 映射到面试情感
-            interview_scores, predicted_emotion, confidence = self.map_to_interview_emotions(original_emotions, scores)
-            
-            result = {
-                'model': 'Wav2Vec2 XLSR',
-                'emotions': interview_scores,
-                'predicted_emotion': predicted_emotion,
-                'confidence': float(confidence)
-            }
-            
-            return result
-            
+            features = self.extract_features(waveforms, model_keys)
         except Exception as e:
-            print(f"Wav2Vec2 XLSR 分析失败: {e}")
-            return None
+            print(f"特征提取失败: {e}")
+            return
+        model_keys = [model_key for model_key in model_keys if model_key in features]
+        
+        pending = list(range(len(batch_results)))
+        
+        # 提前退出: 先运行ExHuBERT，置信度足够高的样本不再运行其余模型(ExHuBERT未参与集成时不提前退出)
+        if self.early_exit_threshold is not None and 'exhubert' in model_keys and len(model_keys) > 1:
+            self._run_models(['exhubert'], features, batch_results, pending)
+            model_keys = [model_key for model_key in model_keys if model_key != 'exhubert']
+            pending = [
+                i for i, result in enumerate(batch_results)
+                if not result['models_results'] or result['models_results'][0]['confidence'] <= self.early_exit_threshold
+            ]
+            for i in set(range(len(batch_results))) - set(pending):
+                expected[i] = 1
+        
+        if pending and model_keys:
+            self._run_models(model_keys, features, batch_results, pending)
+        
+        for result, expected_count in zip(batch_results, expected):
+            result['complete'] = expected_count > 0 and len(result['models_results']) == expected_count
     
-    def analyze_audio(self, audio_path):
+    def analyze_audio_batch(self, waveforms, sr=16000, ensemble_size=None):
         """
-        完整的音频情感分析流程
+        批量音频情感分析流程，每个模型对整批波形只做一次前向推理
         Args:
-            audio_path: 音频文件路径
+            waveforms: 已通过 preprocess_audio 预处理的波形列表
+            sr: 波形采样率
+            ensemble_size: 参与集成的模型数量(按 MODEL_SPECS 顺序取前N个已加载模型)，默认使用全部
         Returns:
-            dict: 包含所有模型分析结果的字典
+            list: 与输入顺序一致的分析结果字典列表(格式同 analyze_audio)
         """
-        print(f"开始分析音频文件: {audio_path}")
-        
-        # 预处理音频
-        waveform, sr = self.preprocess_audio(audio_path)
-        
-        results = {
-            'audio_file': audio_path,
+        batch_results = [{
             'sample_rate': sr,
             'duration': len(waveform) / sr,
             'models_results': []
-        }
-        
-        # 使用所有可用模型进行分析
-        model_functions = [
-            self.analyze_with_exhubert,
-            self.analyze_with_hubert_large,
-            self.analyze_with_wav2vec2_xlsr
-        ]
-        
-        for analyze_func in model_functions:
-            result = analyze_func(waveform)
-            if result:
-                results['models_results'].append(result)
+        } for waveform in waveforms]
+        
+        if not batch_results:
+            return batch_results
+        
+        model_keys = [model_key for model_key in MODEL_SPECS if model_key in self.models][:ensemble_size]
+        
+        # 按长度排序后分桶，每个桶只包含等长样本: ExHuBERT 和 HuBERT 的特征提取器不返回 attention_mask，
+        # 桶内填充的零值会混入较短样本的池化结果。超过 max_length 的片段截断后等长，仍可成批推理
+        # 结果直接写入各样本自己的结果字典，因此无需再恢复原始顺序
+        order = sorted(range(len(waveforms)), key=lambda i: len(waveforms[i]))
+        for _, same_length in itertools.groupby(order, key=lambda i: len(waveforms[i])):
+            same_length = list(same_length)
+            for start in range(0, len(same_length), self.bucket_size):
+                bucket = same_length[start:start + self.bucket_size]
+                self._analyze_bucket(
+                    [waveforms[i] for i in bucket],
+                    [batch_results[i] for i in bucket],
+                    model_keys
+                )
         
         # 生成综合分析结果
-        results['summary'] = self.generate_summary(results['models_results'])
+        for result in batch_results:
+            result['summary'] = self.generate_summary(result['models_results'])
         
-        return results
+        return batch_results
     
     def generate_summary(self, model_results):
         """生成综合分析摘要"""
@@ -367,20 +621,20 @@ class SpeechEmotionAnalyzer:
             return {"error": "无法生成报告，没有有效的分析结果"}
         
         # 统计情感分布
-        emotion_counts = pd.Series(emotions).value_counts()
+        emotion_counts = Counter(emotions)
         
         # 计算情感稳定性
         emotion_stability = len(set(emotions)) / len(emotions)  # 越小越稳定
         
         # 平均置信度
-        avg_confidence = np.mean(confidences)
+        avg_confidence = sum(confidences) / len(confidences)
         
         # 主导情感
-        dominant_emotion = emotion_counts.index[0] if len(emotion_counts) > 0 else "未知"
+        dominant_emotion = emotion_counts.most_common(1)[0][0] if emotion_counts else "未知"
         
         report = {
             'dominant_emotion': dominant_emotion,
-            'emotion_distribution': emotion_counts.to_dict(),
+            'emotion_distribution': dict(emotion_counts.most_common()),
             'emotional_stability': 1 - emotion_stability,  # 转换为稳定性分数
             'average_confidence': avg_confidence,
             'total_segments': len(session_results),
@@ -395,19 +649,8 @@ class SpeechEmotionAnalyzer:
         recommendations = []
         
         # 基于主导情感的建议
-        emotion_advice = {
-            'calm': "表现较为平稳，建议适当表达更多积极情感",
-            'confident': "表现出良好的积极态度，继续保持",
-            'composed': "表现沉着冷静，这是面试的优势",
-            'nervous': "建议控制情绪，保持专业态度",
-            'anxious': "可能需要调整心态，展现更积极的一面",
-            'focused': "建议放松心态，增强自信",
-            'excited': "反应敏锐，但注意保持专业性",
-            'dissatisfied': "建议调整态度，保持开放的心态"
-        }
-        
-        if dominant_emotion in emotion_advice:
-            recommendations.append(emotion_advice[dominant_emotion])
+        if dominant_emotion in EMOTION_ADVICE:
+            recommendations.append(EMOTION_ADVICE[dominant_emotion])
         
         # 基于稳定性的建议
         if stability < 0.7:
@@ -6,9 +6,9 @@
 
 import os
 import sys
-import subprocess
 import time
 import threading
+from importlib.metadata import distribution, PackageNotFoundError
 
 def check_dependencies():
     """检查依赖包"""
@@ -17,19 +17,21 @@ def check_dependencies():
     required_packages = [
         'flask',
         'flask-cors', 
+        'orjson',
         'transformers',
         'torch',
-        'librosa',
+        'torchaudio',
         'soundfile'
     ]
     
     missing_packages = []
     
+    # 只读取已安装包的元数据，不实际导入(避免加载torch等大型库)
     for package in required_packages:
         try:
-            __import__(package.replace('-', '_'))
+            distribution(package)
             print(f"✅ {package}")
-        except ImportError:
+        except PackageNotFoundError:
             print(f"❌ {package}")
             missing_packages.append(package)
     
@@ -41,33 +43,69 @@ def check_dependencies():
     print("✅ 所有依赖包已安装")
     return True
 
+def gunicorn_available():
+    """检查 gunicorn 是否可用(Windows 等平台不支持 gunicorn)"""
+    try:
+        import gunicorn.app.wsgiapp  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def run_production_server():
+    """
+    使用 gunicorn 运行API服务器(配置见 gunicorn.conf.py)
+    当前进程不加载模型，预加载策略由 gunicorn.conf.py 决定(CPU 模式预加载后 fork 共享，GPU 模式各工作进程自行加载)
+    """
+    from gunicorn.app.wsgiapp import WSGIApplication
+    
+    config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = [sys.argv[0], '-c', config_path, 'emotion_api:app']
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
 def start_api_server():
     """启动API服务器"""
     print("\n🚀 启动语音情感分析API服务器...")
     
     try:
         # 导入API模块
-        from emotion_api import app, init_analyzer
+        import emotion_api
+        from emotion_api import app, init_analyzer, MAX_BATCH, MAX_DELAY_MS
         
-        # 初始化分析器
-        if init_analyzer():
-            print("✅ 分析器初始化成功")
+        # 优先使用 gunicorn 生产服务器(模型在 gunicorn 钩子中加载)，不可用时(如Windows)退回Flask内置服务器
+        use_gunicorn = gunicorn_available()
+        if not use_gunicorn:
+            print("⚠️  未找到可用的 gunicorn，使用Flask内置服务器")
             
-            print("\n🎤 语音情感分析API服务器")
-            print("=" * 40)
-            print("🌐 服务地址: http://localhost:5000")
-            print("📋 可用接口:")
-            print("  GET  /health - 健康检查")
-            print("  POST /analyze - 单个音频分析") 
-            print("  POST /batch_analyze - 批量音频分析")
-            print("=" * 40)
-            print("\n💡 提示:")
-            print("  - 按 Ctrl+C 停止服务器")
-            print("  - 在另一个终端运行 python test_api.py 测试API")
-            print("  - 查看 api_integration_guide.md 了解集成方法")
-            print("\n🔥 服务器启动中...")
+            # 初始化分析器(同时启动动态批处理线程)
+            if not init_analyzer():
+                print("❌ 分析器初始化失败")
+                return False
+            print("✅ 分析器初始化成功")
             
-            # 启动Flask服务器
+            # 预热模型，避免首个请求承担额外的初始化开销
+            print("🔥 正在预热模型...")
+            emotion_api.analyzer.warmup()
+            print("✅ 模型预热完成")
+        
+        print(f"✅ 动态批处理配置: 每批最多 {MAX_BATCH} 个请求，最长等待 {MAX_DELAY_MS:g} ms")
+        
+        print("\n🎤 语音情感分析API服务器")
+        print("=" * 40)
+        print("🌐 服务地址: http://localhost:5000")
+        print("📋 可用接口:")
+        print("  GET  /health - 健康检查")
+        print("  POST /analyze - 单个音频分析") 
+        print("  POST /batch_analyze - 批量音频分析")
+        print("=" * 40)
+        print("\n💡 提示:")
+        print("  - 按 Ctrl+C 停止服务器")
+        print("  - 在另一个终端运行 python test_api.py 测试API")
+        print("  - 查看 api_integration_guide.md 了解集成方法")
+        print("\n🔥 服务器启动中...")
+        
+        if use_gunicorn:
+            run_production_server()
+        else:
             app.run(
                 host='0.0.0.0',
                 port=5000,
@@ -75,9 +113,6 @@ def start_api_server():
                 threaded=True,
                 use_reloader=False
             )
-        else:
-            print("❌ 分析器初始化失败")
-            return False
             
     except ImportError as e:
         print(f"❌ 导入模块失败: {e}")
@@ -90,19 +125,38 @@ def start_api_server():
         print(f"❌ 启动失败: {e}")
         return False
 
+def wait_for_server(url='http://localhost:5000/health', timeout=300, interval=0.5):
+    """轮询健康检查接口，服务器就绪时返回True，超时返回False"""
+    import requests
+    
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            response = requests.get(url, timeout=interval)
+            if response.status_code == 200 and response.json().get('success'):
+                return True
+        except (requests.RequestException, ValueError):
+            pass
+        time.sleep(interval)
+    return False
+
 def run_tests():
     """在新线程中运行测试"""
-    time.sleep(10)  # 等待服务器启动
+    if not wait_for_server():
+        print("\n⏱️  等待API服务器就绪超时，跳过自动测试")
+        return
     print("\n🧪 自动运行API测试...")
     
     try:
-        result = subprocess.run([sys.executable, 'test_api.py'], 
-                              capture_output=True, text=True, timeout=120)
-        print(result.stdout)
-        if result.stderr:
-            print("错误信息:", result.stderr)
-    except subprocess.TimeoutExpired:
-        print("⏱️  测试超时")
+        # 直接在当前进程中运行测试，省去启动新解释器和重复导入依赖的开销
+        import test_api
+        
+        # 在单独的线程中运行并限制总时长
+        test_thread = threading.Thread(target=test_api.main, name="api-tests", daemon=True)
+        test_thread.start()
+        test_thread.join(timeout=120)
+        if test_thread.is_alive():
+            print("⏱️  测试超时")
     except Exception as e:
         print(f"⚠️  测试执行失败: {e}")
 
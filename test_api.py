@@ -4,51 +4,89 @@
 API功能测试脚本
 """
 
+import os
+import sys
+import logging
 import requests
 import base64
+import functools
+import io
 import tempfile
 import numpy as np
 import soundfile as sf
-import time
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-def create_test_audio():
-    """创建测试音频文件"""
+# 测试输出统一通过 logging 输出，并发测试时每条消息整行写出，不会互相穿插
+# 使用独立的处理器: 在已配置日志的进程中(如 start_api_server)运行时同样保持该输出格式
+logger = logging.getLogger(__name__)
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter('%(message)s'))
+logger.addHandler(_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+# 所有测试共用一个会话，复用 keep-alive 连接(Session 可在多线程间共享)
+SESSION = requests.Session()
+SESSION.headers.update({'Connection': 'keep-alive'})
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+@functools.lru_cache(maxsize=1)
+def _cached_test_audio_bytes():
+    """生成测试音频并返回WAV字节(每个进程只生成一次)"""
     # 生成测试音频信号
     sample_rate = 16000
     duration = 3.0
     frequency = 1000
     
-    t = np.linspace(0, duration, int(sample_rate * duration), False)
-    audio_signal = np.sin(2 * np.pi * frequency * t) * 0.3
-    noise = np.random.normal(0, 0.05, len(audio_signal))
-    audio_signal = audio_signal + noise
+    # 单个float32缓冲区上原地计算正弦波并叠加噪声
+    # 每次调用使用独立的固定种子生成器: 即使并发线程同时未命中缓存，生成的测试音频也完全一致
+    rng = np.random.default_rng(0)
+    n = int(sample_rate * duration)
+    audio_signal = np.arange(n, dtype=np.float32)
+    audio_signal *= np.float32(2 * np.pi * frequency / sample_rate)
+    np.sin(audio_signal, out=audio_signal)
+    audio_signal *= np.float32(0.3)
+    audio_signal += rng.standard_normal(n, dtype=np.float32) * np.float32(0.05)
     
+    # 直接在内存中编码为16位WAV
+    buffer = io.BytesIO()
+    sf.write(buffer, audio_signal, sample_rate, subtype='PCM_16', format='WAV')
+    return buffer.getvalue()
+
+@functools.lru_cache(maxsize=1)
+def _cached_test_audio_b64():
+    """测试音频的Base64编码(只编码一次，Base64和批量测试共用)"""
+    return base64.b64encode(_cached_test_audio_bytes()).decode('ascii')
+
+def create_test_audio():
+    """创建测试音频文件"""
     # 保存到临时文件
-    temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-    sf.write(temp_file.name, audio_signal, sample_rate)
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as temp_file:
+        temp_file.write(_cached_test_audio_bytes())
     
     return temp_file.name
 
 def test_health_check():
     """测试健康检查接口"""
-    print("🔍 测试健康检查接口...")
+    logger.info("🔍 测试健康检查接口...")
     try:
-        response = requests.get('http://localhost:5000/health', timeout=10)
+        response = SESSION.get('http://localhost:5000/health', timeout=10)
         if response.status_code == 200:
             result = response.json()
-            print(f"✅ 健康检查通过: {result['message']}")
-            print(f"   模型数量: {result['data']['models_loaded']}")
+            logger.info(f"✅ 健康检查通过: {result['message']}")
+            logger.info(f"   模型数量: {result['data']['models_loaded']}")
             return True
         else:
-            print(f"❌ 健康检查失败: {response.status_code}")
+            logger.error(f"❌ 健康检查失败: {response.status_code}")
             return False
     except Exception as e:
-        print(f"❌ 健康检查失败: {e}")
+        logger.error(f"❌ 健康检查失败: {e}")
         return False
 
 def test_file_upload():
     """测试文件上传分析"""
-    print("🔍 测试文件上传分析...")
+    logger.info("🔍 测试文件上传分析...")
     
     # 创建测试音频
     audio_file = create_test_audio()
@@ -56,31 +94,30 @@ def test_file_upload():
     try:
         with open(audio_file, 'rb') as f:
             files = {'audio': f}
-            response = requests.post('http://localhost:5000/analyze', files=files, timeout=30)
+            response = SESSION.post('http://localhost:5000/analyze', files=files, timeout=30)
         
         if response.status_code == 200:
             result = response.json()
             if result['success']:
                 data = result['data']
-                print("✅ 文件上传分析成功")
-                print(f"   情感: {data['final_result']['recommended_emotion']}")
-                print(f"   置信度: {data['final_result']['confidence']:.3f}")
-                print(f"   评分: {data['interview_assessment']['score']}")
-                print(f"   建议: {data['interview_assessment']['recommendations']}")
+                logger.info("✅ 文件上传分析成功")
+                logger.info(f"   情感: {data['final_result']['recommended_emotion']}")
+                logger.info(f"   置信度: {data['final_result']['confidence']:.3f}")
+                logger.info(f"   评分: {data['interview_assessment']['score']}")
+                logger.info(f"   建议: {data['interview_assessment']['recommendations']}")
                 return True
             else:
-                print(f"❌ 分析失败: {result['message']}")
+                logger.error(f"❌ 分析失败: {result['message']}")
                 return False
         else:
-            print(f"❌ 请求失败: {response.status_code}")
+            logger.error(f"❌ 请求失败: {response.status_code}")
             return False
             
     except Exception as e:
-        print(f"❌ 文件上传测试失败: {e}")
+        logger.error(f"❌ 文件上传测试失败: {e}")
         return False
     finally:
         # 清理临时文件
-        import os
         try:
             os.unlink(audio_file)
         except:
@@ -88,21 +125,15 @@ def test_file_upload():
 
 def test_base64_analysis():
     """测试Base64数据分析"""
-    print("🔍 测试Base64数据分析...")
-    
-    # 创建测试音频
-    audio_file = create_test_audio()
+    logger.info("🔍 测试Base64数据分析...")
     
     try:
-        # 读取音频文件并编码为Base64
-        with open(audio_file, 'rb') as f:
-            audio_data = f.read()
-        
-        audio_b64 = base64.b64encode(audio_data).decode('utf-8')
+        # 使用预先编码的Base64测试音频
+        audio_b64 = _cached_test_audio_b64()
         
         # 发送请求
         data = {'audio_data': audio_b64}
-        response = requests.post(
+        response = SESSION.post(
             'http://localhost:5000/analyze',
             json=data,
             headers={'Content-Type': 'application/json'},
@@ -113,50 +144,66 @@ def test_base64_analysis():
             result = response.json()
             if result['success']:
                 data = result['data']
-                print("✅ Base64数据分析成功")
-                print(f"   情感: {data['final_result']['recommended_emotion']}")
-                print(f"   置信度: {data['final_result']['confidence']:.3f}")
-                print(f"   评分: {data['interview_assessment']['score']}")
+                logger.info("✅ Base64数据分析成功")
+                logger.info(f"   情感: {data['final_result']['recommended_emotion']}")
+                logger.info(f"   置信度: {data['final_result']['confidence']:.3f}")
+                logger.info(f"   评分: {data['interview_assessment']['score']}")
                 return True
             else:
-                print(f"❌ 分析失败: {result['message']}")
+                logger.error(f"❌ 分析失败: {result['message']}")
                 return False
         else:
-            print(f"❌ 请求失败: {response.status_code}")
+            logger.error(f"❌ 请求失败: {response.status_code}")
             return False
             
     except Exception as e:
-        print(f"❌ Base64分析测试失败: {e}")
+        logger.error(f"❌ Base64分析测试失败: {e}")
         return False
-    finally:
-        # 清理临时文件
-        import os
-        try:
-            os.unlink(audio_file)
-        except:
-            pass
 
-def test_batch_analysis():
-    """测试批量分析"""
-    print("🔍 测试批量分析...")
+def test_raw_audio_analysis():
+    """测试原始音频字节分析"""
+    logger.info("🔍 测试原始音频字节分析...")
     
     try:
-        # 创建多个测试音频片段
-        audio_segments = []
-        temp_files = []
+        # 直接发送WAV字节，无需Base64编码
+        response = SESSION.post(
+            'http://localhost:5000/analyze',
+            data=_cached_test_audio_bytes(),
+            headers={'Content-Type': 'application/octet-stream'},
+            timeout=30
+        )
         
-        for i in range(3):
-            audio_file = create_test_audio()
-            temp_files.append(audio_file)
+        if response.status_code == 200:
+            result = response.json()
+            if result['success']:
+                data = result['data']
+                logger.info("✅ 原始音频字节分析成功")
+                logger.info(f"   情感: {data['final_result']['recommended_emotion']}")
+                logger.info(f"   置信度: {data['final_result']['confidence']:.3f}")
+                logger.info(f"   评分: {data['interview_assessment']['score']}")
+                return True
+            else:
+                logger.error(f"❌ 分析失败: {result['message']}")
+                return False
+        else:
+            logger.error(f"❌ 请求失败: {response.status_code}")
+            return False
             
-            with open(audio_file, 'rb') as f:
-                audio_data = f.read()
-            audio_b64 = base64.b64encode(audio_data).decode('utf-8')
-            audio_segments.append(audio_b64)
+    except Exception as e:
+        logger.error(f"❌ 原始音频字节测试失败: {e}")
+        return False
+
+def test_batch_analysis():
+    """测试批量分析"""
+    logger.info("🔍 测试批量分析...")
+    
+    try:
+        # 同一段预先编码的测试音频重复作为3个片段
+        audio_segments = [_cached_test_audio_b64()] * 3
         
         # 发送批量分析请求
         data = {'audio_segments': audio_segments}
-        response = requests.post(
+        response = SESSION.post(
             'http://localhost:5000/batch_analyze',
             json=data,
             headers={'Content-Type': 'application/json'},
@@ -167,72 +214,70 @@ def test_batch_analysis():
             result = response.json()
             if result['success']:
                 data = result['data']
-                print("✅ 批量分析成功")
-                print(f"   处理片段: {data['overall_report']['total_segments']}")
-                print(f"   平均评分: {data['overall_report']['average_score']}")
-                print(f"   主导情感: {data['overall_report']['dominant_emotion']}")
-                print(f"   稳定性: {data['overall_report']['stability_level']}")
+                logger.info("✅ 批量分析成功")
+                logger.info(f"   处理片段: {data['overall_report']['total_segments']}")
+                logger.info(f"   平均评分: {data['overall_report']['average_score']}")
+                logger.info(f"   主导情感: {data['overall_report']['dominant_emotion']}")
+                logger.info(f"   稳定性: {data['overall_report']['stability_level']}")
                 return True
             else:
-                print(f"❌ 批量分析失败: {result['message']}")
+                logger.error(f"❌ 批量分析失败: {result['message']}")
                 return False
         else:
-            print(f"❌ 请求失败: {response.status_code}")
+            logger.error(f"❌ 请求失败: {response.status_code}")
             return False
             
     except Exception as e:
-        print(f"❌ 批量分析测试失败: {e}")
+        logger.error(f"❌ 批量分析测试失败: {e}")
         return False
-    finally:
-        # 清理临时文件
-        import os
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
 
 def main():
     """主测试函数"""
-    print("语音情感分析API测试")
-    print("=" * 50)
-    
-    # 等待API服务器启动
-    print("⏳ 等待API服务器启动...")
-    time.sleep(2)
+    logger.info("语音情感分析API测试")
+    logger.info("=" * 50)
     
     tests = [
-        ("健康检查", test_health_check),
         ("文件上传分析", test_file_upload),
         ("Base64数据分析", test_base64_analysis),
+        ("原始音频字节分析", test_raw_audio_analysis),
         ("批量分析", test_batch_analysis)
     ]
     
     passed = 0
-    total = len(tests)
+    total = len(tests) + 1
     
-    for test_name, test_func in tests:
-        print(f"\n📝 测试: {test_name}")
-        print("-" * 30)
+    # 健康检查作为前置条件，服务器就绪后再并发运行其余测试
+    logger.info("\n📝 测试: 健康检查")
+    logger.info("-" * 30)
+    if test_health_check():
+        passed += 1
+        logger.info("✅ 健康检查 测试通过")
         
-        if test_func():
-            passed += 1
-            print(f"✅ {test_name} 测试通过")
-        else:
-            print(f"❌ {test_name} 测试失败")
-        
-        # 测试间隔
-        time.sleep(1)
+        logger.info(f"\n📝 并发运行 {len(tests)} 项分析测试")
+        logger.info("-" * 30)
+        # 并发开始前先生成并缓存测试音频，lru_cache 不加锁，避免多个线程同时重复生成
+        _cached_test_audio_b64()
+        with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+            futures = {executor.submit(test_func): test_name for test_name, test_func in tests}
+            for future in as_completed(futures):
+                test_name = futures[future]
+                if future.result():
+                    passed += 1
+                    logger.info(f"✅ {test_name} 测试通过")
+                else:
+                    logger.error(f"❌ {test_name} 测试失败")
+    else:
+        logger.error("❌ 健康检查 测试失败，跳过其余测试")
     
-    print("\n" + "=" * 50)
-    print(f"🎯 测试结果: {passed}/{total} 测试通过")
+    logger.info("\n" + "=" * 50)
+    logger.info(f"🎯 测试结果: {passed}/{total} 测试通过")
     
     if passed == total:
-        print("所有API测试通过！")
-        print("\nAPI服务器运行正常，可以集成到面试系统中")
-        print("集成指南: 请查看 api_integration_guide.md")
+        logger.info("所有API测试通过！")
+        logger.info("\nAPI服务器运行正常，可以集成到面试系统中")
+        logger.info("集成指南: 请查看 api_integration_guide.md")
     else:
-        print("部分测试失败，请检查API服务器状态")
+        logger.info("部分测试失败，请检查API服务器状态")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -7,56 +7,111 @@
 
 import os
 import sys
+import logging
 import numpy as np
 import librosa
+import soundfile as sf
 import tempfile
+import time
+
+# 测试输出只保留消息本身；emotion_api 导入后的服务端日志沿用同一配置
+logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+logger = logging.getLogger(__name__)
+
+# 噪声随机数生成器: 固定种子，每次运行分析的都是同一段测试音频，便于对比前后结果
+rng = np.random.default_rng(0)
 
 def test_basic_imports():
     """测试基础库导入"""
-    print("🔍 测试基础库导入...")
+    logger.info("🔍 测试基础库导入...")
     
     try:
         import torch
         import transformers
         import librosa
-        import pandas
         import numpy
         import flask
-        print("✅ 所有基础库导入成功")
+        logger.info("✅ 所有基础库导入成功")
         return True
     except ImportError as e:
-        print(f"❌ 库导入失败: {e}")
+        logger.error(f"❌ 库导入失败: {e}")
         return False
 
 def test_models_loading():
     """测试模型加载功能"""
-    print("🔍 测试模型加载功能...")
+    logger.info("🔍 测试模型加载功能...")
     
     try:
         # 首先测试不需要下载模型的基础功能
         from speech_emotion_analyzer import SpeechEmotionAnalyzer
         
-        print("⏳ 初始化语音情感分析器...")
+        logger.info("⏳ 初始化语音情感分析器...")
         analyzer = SpeechEmotionAnalyzer()
         
-        print(f"✅ 分析器初始化成功，已加载 {len(analyzer.models)} 个模型")
+        logger.info(f"✅ 分析器初始化成功，已加载 {len(analyzer.models)} 个模型")
         
         # 列出加载的模型
         if analyzer.models:
             for model_name in analyzer.models.keys():
-                print(f"   - {model_name}")
+                logger.info(f"   - {model_name}")
         else:
-            print("⚠️  未加载任何模型，但系统仍可使用")
+            logger.warning("⚠️  未加载任何模型，但系统仍可使用")
+        
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ 模型加载测试失败: {e}")
+        return False
+
+def test_request_batcher():
+    """测试请求微批处理器(使用模拟的批量分析函数，无需加载模型)"""
+    logger.info("🔍 测试请求微批处理器...")
+    
+    try:
+        from emotion_api import RequestBatcher
+        
+        calls = []
+        def fake_analyze_batch(waveforms, ensemble_size=None):
+            calls.append((len(waveforms), ensemble_size))
+            if ensemble_size == 3:
+                raise RuntimeError("模拟推理失败")
+            return [{"waveform": waveform, "ensemble_size": ensemble_size} for waveform in waveforms]
+        
+        batcher = RequestBatcher(fake_analyze_batch, max_batch=4, max_delay_ms=200)
+        
+        # 同一批次内按 ensemble_size 分组推理，结果按提交顺序返回给各自的请求
+        futures = [batcher.submit_async(i, ensemble_size=1 if i % 2 else None) for i in range(4)]
+        results = [future.result(timeout=5) for future in futures]
+        assert [r["waveform"] for r in results] == [0, 1, 2, 3], f"结果与请求不对应: {results}"
+        assert all(r["ensemble_size"] == (1 if r["waveform"] % 2 else None) for r in results), "ensemble_size 分组错误"
+        assert set(calls) == {(2, None), (2, 1)}, f"批次划分错误: {calls}"
+        logger.info("   ✓ 按 ensemble_size 分组")
+        
+        # 凑不满批次时等待 max_delay 后单独推理
+        calls.clear()
+        start = time.monotonic()
+        batcher.submit(10, timeout=5)
+        elapsed = time.monotonic() - start
+        assert calls == [(1, None)], f"批次划分错误: {calls}"
+        assert 0.15 <= elapsed < 2, f"等待时间异常: {elapsed:.3f}s"
+        logger.info(f"   ✓ 最长等待后提交 ({elapsed * 1000:.0f} ms)")
+        
+        # 推理失败时同批次的每个请求都收到异常，批处理线程继续工作
+        failed = [batcher.submit_async(i, ensemble_size=3) for i in range(2)]
+        assert all(isinstance(future.exception(timeout=5), RuntimeError) for future in failed), "异常未传递给所有请求"
+        assert batcher.submit(20, timeout=5)["waveform"] == 20, "推理失败后批处理器无法继续工作"
+        logger.info("   ✓ 异常传递给同批次所有请求")
         
+        logger.info("✅ 请求微批处理器工作正常")
         return True
         
     except Exception as e:
-        print(f"❌ 模型加载测试失败: {e}")
+        logger.error(f"❌ 请求微批处理器测试失败: {e}")
         return False
 
 def create_test_audio():
     """创建测试音频文件"""
-    print("🔍 创建测试音频文件...")
+    logger.info("🔍 创建测试音频文件...")
     
     try:
         # 生成一个简单的测试音频信号 (3秒，1000Hz正弦波)
@@ -64,28 +119,30 @@ def create_test_audio():
         duration = 3.0
         frequency = 1000
         
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
-        audio_signal = np.sin(2 * np.pi * frequency * t) * 0.3
+        # 在单个float32缓冲区上原地计算正弦波
+        n = int(sample_rate * duration)
+        audio_signal = np.arange(n, dtype=np.float32)
+        audio_signal *= np.float32(2 * np.pi * frequency / sample_rate)
+        np.sin(audio_signal, out=audio_signal)
+        audio_signal *= np.float32(0.3)
         
         # 添加一些随机噪声使其更像真实语音
-        noise = np.random.normal(0, 0.05, len(audio_signal))
-        audio_signal = audio_signal + noise
+        audio_signal += rng.standard_normal(n, dtype=np.float32) * np.float32(0.05)
         
         # 保存到临时文件
         temp_file = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-        import soundfile as sf
-        sf.write(temp_file.name, audio_signal, sample_rate)
+        sf.write(temp_file.name, audio_signal, sample_rate, subtype='PCM_16')
         
-        print(f"✅ 测试音频创建成功: {temp_file.name}")
+        logger.info(f"✅ 测试音频创建成功: {temp_file.name}")
         return temp_file.name
         
     except Exception as e:
-        print(f"❌ 测试音频创建失败: {e}")
+        logger.error(f"❌ 测试音频创建失败: {e}")
         return None
 
 def test_audio_analysis(audio_file):
     """测试音频分析功能"""
-    print("🔍 测试音频分析功能...")
+    logger.info("🔍 测试音频分析功能...")
     
     try:
         from speech_emotion_analyzer import SpeechEmotionAnalyzer
@@ -93,75 +150,76 @@ def test_audio_analysis(audio_file):
         analyzer = SpeechEmotionAnalyzer()
         
         if not analyzer.models:
-            print("⚠️  没有可用的模型，跳过分析测试")
+            logger.warning("⚠️  没有可用的模型，跳过分析测试")
             return True
         
-        print("⏳ 开始分析测试音频...")
+        logger.info("⏳ 开始分析测试音频...")
         result = analyzer.analyze_audio(audio_file)
         
-        print("✅ 音频分析完成!")
-        print(f"   文件: {os.path.basename(result['audio_file'])}")
-        print(f"   时长: {result['duration']:.2f} 秒")
-        print(f"   采样率: {result['sample_rate']} Hz")
-        print(f"   模型结果: {len(result['models_results'])} 个")
+        logger.info("✅ 音频分析完成!")
+        logger.info(f"   文件: {os.path.basename(result['audio_file'])}")
+        logger.info(f"   时长: {result['duration']:.2f} 秒")
+        logger.info(f"   采样率: {result['sample_rate']} Hz")
+        logger.info(f"   模型结果: {len(result['models_results'])} 个")
         
         if result['models_results']:
             best_result = result['summary']
-            print(f"   推荐情感: {best_result.get('recommended_emotion', '未知')}")
-            print(f"   置信度: {best_result.get('confidence', 0):.3f}")
+            logger.info(f"   推荐情感: {best_result.get('recommended_emotion', '未知')}")
+            logger.info(f"   置信度: {best_result.get('confidence', 0):.3f}")
         
         return True
         
     except Exception as e:
-        print(f"❌ 音频分析测试失败: {e}")
+        logger.error(f"❌ 音频分析测试失败: {e}")
         return False
 
 def test_api_functionality():
     """测试API功能"""
-    print("🔍 测试API功能...")
+    logger.info("🔍 测试API功能...")
     
     try:
         from emotion_api import app, init_analyzer
         
         # 测试分析器初始化
         if init_analyzer():
-            print("✅ API分析器初始化成功")
+            logger.info("✅ API分析器初始化成功")
         else:
-            print("⚠️  API分析器初始化失败，但系统仍可测试")
+            logger.warning("⚠️  API分析器初始化失败，但系统仍可测试")
         
         # 测试Flask应用创建
         if app:
-            print("✅ Flask应用创建成功")
+            logger.info("✅ Flask应用创建成功")
         
-        print("✅ API功能测试通过")
+        logger.info("✅ API功能测试通过")
         return True
         
     except Exception as e:
-        print(f"❌ API功能测试失败: {e}")
+        logger.error(f"❌ API功能测试失败: {e}")
         return False
 
 def cleanup_test_files(files):
     """清理测试文件"""
-    print("🧹 清理测试文件...")
+    logger.info("🧹 清理测试文件...")
     
     for file in files:
         try:
             if file and os.path.exists(file):
                 os.unlink(file)
-                print(f"✅ 删除测试文件: {os.path.basename(file)}")
+                logger.info(f"✅ 删除测试文件: {os.path.basename(file)}")
         except Exception as e:
-            print(f"⚠️  删除文件失败: {e}")
+            logger.warning(f"⚠️  删除文件失败: {e}")
 
 def main():
     """主测试函数"""
-    print("🎤 语音情感分析系统测试")
-    print("=" * 40)
+    logger.info("🎤 语音情感分析系统测试")
+    logger.info("=" * 40)
     
     test_files = []
     
     # 运行各种测试
     tests = [
         ("基础库导入", test_basic_imports),
+        ("请求微批处理", test_request_batcher),
         ("模型加载", test_models_loading),
         ("API功能", test_api_functionality)
     ]
@@ -170,47 +228,47 @@ def main():
     total = len(tests)
     
     for test_name, test_func in tests:
-        print(f"\n📝 测试: {test_name}")
-        print("-" * 30)
+        logger.info(f"\n📝 测试: {test_name}")
+        logger.info("-" * 30)
         
         if test_func():
             passed += 1
-            print(f"✅ {test_name} 测试通过")
+            logger.info(f"✅ {test_name} 测试通过")
         else:
-            print(f"❌ {test_name} 测试失败")
+            logger.error(f"❌ {test_name} 测试失败")
     
     # 音频分析测试（需要先创建测试文件）
-    print(f"\n📝 测试: 音频分析")
-    print("-" * 30)
+    logger.info(f"\n📝 测试: 音频分析")
+    logger.info("-" * 30)
     
     test_audio = create_test_audio()
     if test_audio:
         test_files.append(test_audio)
         if test_audio_analysis(test_audio):
             passed += 1
-            print("✅ 音频分析 测试通过")
+            logger.info("✅ 音频分析 测试通过")
         else:
-            print("❌ 音频分析 测试失败")
+            logger.error("❌ 音频分析 测试失败")
         total += 1
     else:
-        print("⚠️  跳过音频分析测试（无法创建测试文件）")
+        logger.warning("⚠️  跳过音频分析测试（无法创建测试文件）")
     
     # 清理测试文件
     cleanup_test_files(test_files)
     
     # 输出测试结果
-    print("\n" + "=" * 40)
-    print(f"🎯 测试结果: {passed}/{total} 测试通过")
+    logger.info("\n" + "=" * 40)
+    logger.info(f"🎯 测试结果: {passed}/{total} 测试通过")
     
     if passed == total:
-        print("🎉 所有测试通过！系统可以正常使用")
-        print("\n🚀 可以运行以下命令启动系统:")
-        print("   python interview_demo.py")
+        logger.info("🎉 所有测试通过！系统可以正常使用")
+        logger.info("\n🚀 可以运行以下命令启动系统:")
+        logger.info("   python interview_demo.py")
     elif passed >= total * 0.7:
-        print("⚠️  大部分测试通过，系统基本可用")
-        print("💡 建议检查失败的测试项目")
+        logger.warning("⚠️  大部分测试通过，系统基本可用")
+        logger.info("💡 建议检查失败的测试项目")
     else:
-        print("❌ 多个测试失败，可能需要检查环境配置")
+        logger.error("❌ 多个测试失败，可能需要检查环境配置")
     
     return passed == total
 